@@ -2,8 +2,12 @@ import streamlit as st
 import requests
 import json
 import pandas as pd
-from collections import Counter
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import re
+import threading
+import time
 
 # Page configuration
 st.set_page_config(
@@ -12,93 +16,290 @@ st.set_page_config(
     layout="wide"
 )
 
-# Main analysis function
-def run_analysis(shop_id, environment, search_keyword, check_groups, match_types, result_size):
+# Maps the non-breaking space to a plain space in a single pass over product text
+NBSP_TRANSLATION = str.maketrans({0xa0: 0x20})
+
+def flatten_text(obj, out):
     """
-    Performs a search API call and analyzes the results for relevance.
-    Also formats product data for external LLM analysis.
+    Appends the keys and leaf values of a decoded JSON object to `out`.
+    Joining the result with newlines gives the searchable text of a product.
+    """
+    if isinstance(obj, str):
+        # Some feeds carry a literal, already-escaped "\u00a0" inside their text;
+        # only those leaves are lowercased here, so "\U00A0" is caught as well
+        out.append(obj.lower().replace('\\u00a0', ' ') if '\\' in obj else obj)
+    elif isinstance(obj, dict):
+        for key, value in obj.items():
+            out.append(key)
+            flatten_text(value, out)
+    elif isinstance(obj, list):
+        for item in obj:
+            flatten_text(item, out)
+    elif obj is not None:
+        out.append(str(obj))
+
+def normalize_text(text):
+    """
+    Lowercases joined product text and turns nbsp characters into plain spaces.
+    """
+    # Lowercased once over the joined text rather than once per leaf. Collapsing
+    # double spaces keeps multi-word variations matching across nbsp runs.
+    return text.lower().translate(NBSP_TRANSLATION).replace('  ', ' ')
+
+def product_search_text(product_payload):
+    """
+    Returns the lowercased, whitespace-normalized text that check groups are matched against.
+    This is decoded text on purpose: raw JSON bytes keep escape sequences (\\", \\uXXXX)
+    that hide literals from a substring search, and bytes.lower() only folds ASCII.
+    """
+    product_text_parts = []
+    flatten_text(product_payload, product_text_parts)
+    # A newline separator cannot occur in a variation, so no match spans two values
+    return normalize_text('\n'.join(product_text_parts))
+
+def product_summary_text(product_payload):
+    """
+    Returns only the title and description, normalized like product_search_text.
+    Both appear unchanged in the full text, so a group matched here matches there too.
+    """
+    product_text_parts = []
+    for field in ('title', 'description'):
+        if isinstance(product_payload.get(field), str):
+            flatten_text(product_payload[field], product_text_parts)
+    # A newline separator cannot occur in a variation, so no match spans both fields
+    return normalize_text('\n'.join(product_text_parts))
+
+def match_groups(product_as_string, contains_literals, equals_patterns, all_groups_mask, hit_mask=0):
+    """
+    Returns a bitmask with bit `i` set when check group `i` matches the product text.
+    Groups already set in `hit_mask` are not rescanned, and scanning stops as soon
+    as every group in `all_groups_mask` has matched.
+    """
+    for variation, group_mask in contains_literals:
+        if group_mask & ~hit_mask and variation in product_as_string:
+            hit_mask |= group_mask
+            if hit_mask == all_groups_mask:
+                return hit_mask
+    for group_bit, prefilter, pattern in equals_patterns:
+        if group_bit & hit_mask:
+            continue
+        if any(v in product_as_string for v in prefilter) and pattern.search(product_as_string):
+            hit_mask |= group_bit
+            if hit_mask == all_groups_mask:
+                return hit_mask
+    return hit_mask
+
+@st.cache_resource
+def get_session():
+    """
+    Returns a requests session shared across reruns so warm calls reuse the
+    pooled keep-alive connection instead of a fresh TCP/TLS handshake.
+    """
+    session = requests.Session()
+    session.headers.update({'Content-Type': 'application/json'})
+    return session
+
+# Search responses are cached for this long; stored ETags live for one more such
+# window so an expired response can still be revalidated, and at most
+# ETAG_STORE_MAX_ENTRIES searches are remembered at once
+FETCH_CACHE_TTL = 300
+ETAG_MAX_AGE = 2 * FETCH_CACHE_TTL
+ETAG_STORE_MAX_ENTRIES = 32
+
+@st.cache_resource
+def get_etag_store():
+    """
+    Returns the process-wide LRU map of search inputs to (stored_at, ETag, raw body)
+    used to revalidate a search with If-None-Match, and the lock guarding it.
+    """
+    return OrderedDict(), threading.Lock()
+
+def get_stored_etag(etag_key):
+    """
+    Returns the (ETag, body) pair stored for a search, or None if it is missing or too old.
+    """
+    entries, lock = get_etag_store()
+    with lock:
+        entry = entries.get(etag_key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > ETAG_MAX_AGE:
+            del entries[etag_key]
+            return None
+        entries.move_to_end(etag_key)
+        return entry[1], entry[2]
+
+def store_etag(etag_key, etag, body):
+    """
+    Remembers the ETag of a search response, evicting expired and least recently used entries.
+    """
+    entries, lock = get_etag_store()
+    now = time.monotonic()
+    with lock:
+        entries[etag_key] = (now, etag, body)
+        entries.move_to_end(etag_key)
+        while entries:
+            oldest_stored_at = next(iter(entries.values()))[0]
+            if len(entries) <= ETAG_STORE_MAX_ENTRIES and now - oldest_stored_at <= ETAG_MAX_AGE:
+                break
+            entries.popitem(last=False)
+
+@st.cache_data(ttl=FETCH_CACHE_TTL, show_spinner=False)
+def fetch_products(shop_id, environment, search_keyword, result_size):
+    """
+    Calls the search API and returns its list of products.
+    Results are cached for five minutes per set of inputs; once that expires a
+    stored ETag lets the server answer 304 instead of resending the payload.
     """
     url = f'https://search-{environment}-dlp-adept-search.search-prod.adeptmind.app/search?shop_id={shop_id}'
-    headers = {'Content-Type': 'application/json'}
     payload = {
         "query": search_keyword,
         "size": result_size,
         "force_exploding_variants": False,
     }
+    etag_key = (shop_id, environment, search_keyword, result_size)
+    cached = get_stored_etag(etag_key)
+    headers = {'If-None-Match': cached[0]} if cached else {}
 
-    try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload), timeout=30)
+    response = get_session().post(url, headers=headers, data=json.dumps(payload), timeout=30)
+    if response.status_code == 304 and cached:
+        body = cached[1]
+        # Each confirmation restarts the entry's max age
+        store_etag(etag_key, response.headers.get('ETag', cached[0]), body)
+    else:
         response.raise_for_status()
+        body = response.content
+        # The raw body is stored rather than the parsed products: it is about half the size
+        if response.headers.get('ETag'):
+            store_etag(etag_key, response.headers['ETag'], body)
+
+    # Decode straight from the body bytes rather than via response.text
+    return json.loads(body).get("products", [])
+
+def analyze_products(search_keyword, products, check_groups, match_types):
+    """
+    Analyzes the returned products for relevance against the check groups.
+    Also formats product data for external LLM analysis.
+    """
+    # Product text is lowercased, so variations are too (a no-op for UI input)
+    check_groups = [[variation.lower() for variation in group] for group in check_groups]
 
-        products = response.json().get("products", [])
+    # --- Compile each group's matcher once, outside the product loop ---
+    # Each unique 'Text Contains' literal maps to a bitmask of the groups it
+    # satisfies, so a literal shared by several groups is scanned once per product.
+    # 'Text Equals' duplicates are dropped and longer literals tried first so a
+    # single scan settles on a variation without backtracking through its prefixes.
+    # The regex only runs once a plain substring check finds one of its literals.
+    # Substring checks go shortest literal first, and a literal containing another
+    # one that already covers its groups is skipped since it can add no new hit.
+    contains_literals = {}
+    equals_patterns = []
+    for group_idx, (match_type, group_variations) in enumerate(zip(match_types, check_groups)):
+        group_bit = 1 << group_idx
+        if match_type == 'Text Equals':
+            literals = tuple(sorted(dict.fromkeys(group_variations), key=len, reverse=True))
+            pattern = re.compile(r'\b(?:' + '|'.join(re.escape(v) for v in literals) + r')\b')
+            prefilter = tuple(v for v in reversed(literals) if not any(o != v and o in v for o in literals))
+            equals_patterns.append((group_bit, prefilter, pattern))
+        else:
+            for variation in group_variations:
+                contains_literals[variation] = contains_literals.get(variation, 0) | group_bit
+    contains_literals = tuple(
+        (variation, group_mask)
+        for variation, group_mask in sorted(contains_literals.items(), key=lambda item: len(item[0]))
+        if not any(
+            other != variation and other in variation and not group_mask & ~other_mask
+            for other, other_mask in contains_literals.items()
+        )
+    )
 
-        if not products:
-            return {"status": "error", "message": f"No products were returned for the search term '{search_keyword}'."}
+    all_groups_mask = (1 << len(check_groups)) - 1
 
-        irrelevant_products_data = []
-        relevant_products_data = []
-        failure_reason_counter = Counter()
-        llm_formatted_texts = [] #List to hold formatted text for LLM
+    # Result tables are built column by column; the failed group indices of each
+    # irrelevant product are kept in a parallel list, outside the table
+    relevant_products_data = {"Position": [], "Product ID": [], "Product Name": []}
+    irrelevant_products_data = {"Position": [], "Product ID": [], "Product Name": []}
+    irrelevant_failed_indices = []
+    all_failed_group_indices = []
+    llm_formatted_texts = [] #List to hold formatted text for LLM
 
-        for i, product_payload in enumerate(products):
-            # --- LLM Data Extraction ---
-            title = product_payload.get('title', 'N/A')
-            description = product_payload.get('description', 'N/A')
-            product_text_for_llm = f"""prod {i + 1}:
+    for i, product_payload in enumerate(products):
+        # --- LLM Data Extraction ---
+        title = product_payload.get('title', 'N/A')
+        description = product_payload.get('description', 'N/A')
+        product_text_for_llm = f"""prod {i + 1}:
 title: {title}
 description: {description}"""
-            llm_formatted_texts.append(product_text_for_llm)
-
-            product_as_string = json.dumps(product_payload, ensure_ascii=False).lower()
-            product_as_string = product_as_string.replace('\u00a0', ' ')
-            product_as_string = product_as_string.replace('\\u00a0', ' ')
-            product_as_string = product_as_string.replace('  ', ' ')
-
-            failed_group_indices = []
-            # --- MODIFIED: Check each group with its specific match type ---
-            for group_idx, group_variations in enumerate(check_groups):
-                match_type_for_group = match_types[group_idx]
-                match_found = False
-                for variation in group_variations:
-                    if match_type_for_group == 'Text Contains':
-                        if variation in product_as_string:
-                            match_found = True
-                            break
-                    elif match_type_for_group == 'Text Equals':
-                        if re.search(r'\b' + re.escape(variation) + r'\b', product_as_string):
-                            match_found = True
-                            break
-                if not match_found:
-                    failed_group_indices.append(group_idx)
-
-            if not failed_group_indices:
-                relevant_products_data.append({
-                    "Position": i + 1,
-                    "Product ID": product_payload.get('product_id', 'N/A'),
-                    "Product Name": title
-                })
-            else:
-                irrelevant_products_data.append({
-                    "Position": i + 1,
-                    "Product ID": product_payload.get('product_id', 'N/A'),
-                    "Product Name": title,
-                    "failed_indices": failed_group_indices
-                })
-                failure_reason_counter.update(failed_group_indices)
-
-        # --- Format Final LLM Output ---
-        final_llm_output = f"search term: {search_keyword}\n\n"
-        final_llm_output += "\n\n".join(llm_formatted_texts)
-
-        return {
-            "status": "success",
-            "total_products": len(products),
-            "relevant_products": relevant_products_data,
-            "irrelevant_products": irrelevant_products_data,
-            "failure_summary": failure_reason_counter,
-            "llm_formatted_output": final_llm_output
-        }
+        llm_formatted_texts.append(product_text_for_llm)
+
+        # --- Check each group with its specific match type ---
+        # Title and description are tried first; the whole payload is only
+        # flattened to re-check the groups they leave unmatched.
+        hit_mask = match_groups(product_summary_text(product_payload), contains_literals, equals_patterns, all_groups_mask)
+        if hit_mask != all_groups_mask:
+            hit_mask = match_groups(
+                product_search_text(product_payload), contains_literals, equals_patterns, all_groups_mask, hit_mask
+            )
+        failed_group_indices = [g for g in range(len(check_groups)) if not (hit_mask >> g) & 1]
+
+        if not failed_group_indices:
+            products_data = relevant_products_data
+        else:
+            products_data = irrelevant_products_data
+            irrelevant_failed_indices.append(failed_group_indices)
+            all_failed_group_indices.extend(failed_group_indices)
+        products_data["Position"].append(i + 1)
+        products_data["Product ID"].append(product_payload.get('product_id', 'N/A'))
+        products_data["Product Name"].append(title)
+
+    # --- Count failures per group in one pass ---
+    failure_counts = np.bincount(all_failed_group_indices, minlength=len(check_groups))
+
+    # --- Format Final LLM Output ---
+    final_llm_output = f"search term: {search_keyword}\n\n"
+    final_llm_output += "\n\n".join(llm_formatted_texts)
+
+    return {
+        "status": "success",
+        "total_products": len(products),
+        "relevant_products": relevant_products_data,
+        "irrelevant_products": irrelevant_products_data,
+        "irrelevant_failed_indices": irrelevant_failed_indices,
+        "failure_counts": failure_counts,
+        "llm_formatted_output": final_llm_output
+    }
+
+class NoProductsError(Exception):
+    """
+    Raised when a search returns no products; raising keeps the outcome out of st.cache_data.
+    """
+
+@st.cache_data(ttl=FETCH_CACHE_TTL, show_spinner=False)
+def search_and_analyze(shop_id, environment, search_keyword, check_groups, match_types, result_size):
+    """
+    Fetches and analyzes one search. Cached on its (hashable) inputs, so a rerun
+    with unchanged inputs skips both the API call and the product scan.
+    """
+    products = fetch_products(shop_id, environment, search_keyword, result_size)
+
+    if not products:
+        raise NoProductsError(search_keyword)
 
+    return analyze_products(search_keyword, products, check_groups, match_types)
+
+# Main analysis function
+def run_analysis(shop_id, environment, search_keyword, check_groups, match_types, result_size):
+    """
+    Performs a search API call and analyzes the results for relevance.
+    """
+    try:
+        return search_and_analyze(
+            shop_id, environment, search_keyword,
+            tuple(tuple(group) for group in check_groups), tuple(match_types), result_size
+        )
+
+    except NoProductsError:
+        return {"status": "error", "message": f"No products were returned for the search term '{search_keyword}'."}
     except requests.exceptions.HTTPError as e:
         return {"status": "error", "message": f"API Error (Status Code: {e.response.status_code}): {e.response.text}"}
     except requests.exceptions.RequestException as e:
@@ -168,85 +369,100 @@ st.markdown("---")
 
 with st.form("search_form"):
     st.subheader("🔍 Search and Analyze")
-    search_keyword_input = st.text_input(
-        "Enter the keyword to SEARCH on the API",
-        placeholder="e.g., samsung hdr10+ tvs"
+    search_keyword_input = st.text_area(
+        "Enter the keywords to SEARCH on the API (one per line)",
+        placeholder="e.g., samsung hdr10+ tvs\nlg hdr10+ tvs"
     )
     submitted = st.form_submit_button("Analyze Assortment", type="primary", use_container_width=True)
 
 if submitted:
     check_group_inputs = st.session_state.check_groups_state
     
-    if not all([shop_id, search_keyword_input] + [inp.strip() for inp in check_group_inputs]):
+    # Deduplicated, order-preserving list of the keywords entered one per line
+    search_keywords = list(dict.fromkeys(kw.strip() for kw in search_keyword_input.splitlines() if kw.strip()))
+
+    if not all([shop_id, search_keywords] + [inp.strip() for inp in check_group_inputs]):
         st.warning("Please fill in all fields: Shop ID, Search Keyword, and all Check Groups cannot be empty.")
     else:
-        search_keyword = search_keyword_input.strip()
         check_groups = [ [kw.strip().lower() for kw in group_str.split(',')] for group_str in check_group_inputs if group_str.strip() ]
         match_types = st.session_state.match_types_state # Get the list of match types
+        group_labels = [f"'{group[0]}...'" for group in check_groups] # Shared by every keyword's tables
         
         if not check_groups:
              st.error("You must define at least one valid check group.")
         else:
-            with st.spinner(f"Analyzing top {search_result_size} results for '{search_keyword}'..."):
-                # --- MODIFIED: Pass the list of match types to the analysis function ---
-                analysis_result = run_analysis(shop_id.strip(), environment, search_keyword, check_groups, match_types, search_result_size)
-
             st.subheader("📊 Assortment Quality")
 
-            if analysis_result["status"] == "error":
-                st.error(f"**Error:** {analysis_result['message']}")
-            elif analysis_result["status"] == "success":
-                st.markdown(f"**Search Term:** `{search_keyword}`")
-                
-                total = analysis_result['total_products']
-                relevant_list = analysis_result['relevant_products']
-                irrelevant_list = analysis_result['irrelevant_products']
-                relevance_percentage = (len(relevant_list) / total * 100) if total > 0 else 0
-                
-                col1, col2 = st.columns(2)
-                col1.metric("Relevance Score", f"{len(relevant_list)} / {total}", help="Products containing a match from ALL check groups.")
-                col2.metric("Relevance Percentage", f"{relevance_percentage:.1f}%")
-                
-                st.markdown("---")
-                
-                with st.expander("📋 Formatted Output for LLM Analysis", expanded=False):
-                    llm_output = analysis_result.get("llm_formatted_output", "No output generated.")
-                    st.text_area(
-                        label="Copy the text below to use in an external LLM tool:",
-                        value=llm_output,
-                        height=400,
-                        key="llm_output_textarea"
-                    )
-                
-                col_irrelevant, col_relevant = st.columns(2)
-                with col_irrelevant:
-                    if irrelevant_list:
-                        st.error(f"🚨 Found {len(irrelevant_list)} Irrelevant Products")
-                        with st.expander("Show Failure Analysis"):
-                            failure_summary = analysis_result['failure_summary']
-                            summary_data = []
-                            for group_idx, count in sorted(failure_summary.items()):
-                                group_name = f"Group {group_idx+1}: '{check_groups[group_idx][0]}...'"
-                                summary_data.append({"Missing Concept Group": group_name, "Number of Products Failed": count})
-                            if summary_data:
-                                st.table(pd.DataFrame(summary_data))
-                        
-                        for item in irrelevant_list:
-                            failed_reasons = [f"'{check_groups[idx][0]}...'" for idx in item['failed_indices']]
-                            item["Missing Concepts"] = f"Missing: {', '.join(failed_reasons)}"
-                        
-                        df_irrelevant = pd.DataFrame(irrelevant_list).drop(columns=['failed_indices'])
-                        st.dataframe(df_irrelevant, use_container_width=True)
-                    else:
-                        st.info("No irrelevant products found.")
-
-                with col_relevant:
-                    if relevant_list:
-                        st.success(f"✅ Found {len(relevant_list)} Relevant Products")
-                        df_relevant = pd.DataFrame(relevant_list)
-                        st.dataframe(df_relevant, use_container_width=True)
-                    else:
-                        st.info("No relevant products found.")
-
-                if not irrelevant_list and total > 0:
-                    st.success("Perfect! All returned products were relevant.")
+            # All searches are issued concurrently over the shared session; each
+            # keyword is rendered as soon as its own analysis is ready.
+            with ThreadPoolExecutor(max_workers=min(8, len(search_keywords))) as executor:
+                futures = [
+                    executor.submit(run_analysis, shop_id.strip(), environment, search_keyword, check_groups, match_types, search_result_size)
+                    for search_keyword in search_keywords
+                ]
+                for result_idx, (search_keyword, future) in enumerate(zip(search_keywords, futures)):
+                    if result_idx:
+                        st.markdown("---")
+                    with st.spinner(f"Analyzing top {search_result_size} results for '{search_keyword}'..."):
+                        analysis_result = future.result()
+
+                    if analysis_result["status"] == "error":
+                        st.error(f"**Error for `{search_keyword}`:** {analysis_result['message']}")
+                    elif analysis_result["status"] == "success":
+                        st.markdown(f"**Search Term:** `{search_keyword}`")
+
+                        total = analysis_result['total_products']
+                        relevant_columns = analysis_result['relevant_products']
+                        irrelevant_columns = analysis_result['irrelevant_products']
+                        relevant_count = len(relevant_columns["Position"])
+                        irrelevant_count = len(irrelevant_columns["Position"])
+                        relevance_percentage = (relevant_count / total * 100) if total > 0 else 0
+
+                        col1, col2 = st.columns(2)
+                        col1.metric("Relevance Score", f"{relevant_count} / {total}", help="Products containing a match from ALL check groups.")
+                        col2.metric("Relevance Percentage", f"{relevance_percentage:.1f}%")
+
+                        st.markdown("---")
+
+                        with st.expander("📋 Formatted Output for LLM Analysis", expanded=False):
+                            llm_output = analysis_result.get("llm_formatted_output", "No output generated.")
+                            st.text_area(
+                                label="Copy the text below to use in an external LLM tool:",
+                                value=llm_output,
+                                height=400,
+                                key=f"llm_output_textarea_{result_idx}"
+                            )
+
+                        col_irrelevant, col_relevant = st.columns(2)
+                        with col_irrelevant:
+                            if irrelevant_count:
+                                st.error(f"🚨 Found {irrelevant_count} Irrelevant Products")
+                                with st.expander("Show Failure Analysis"):
+                                    failure_counts = analysis_result['failure_counts']
+                                    failed_groups = np.flatnonzero(failure_counts)
+                                    if failed_groups.size:
+                                        st.table(pd.DataFrame({
+                                            "Missing Concept Group": [f"Group {group_idx+1}: {group_labels[group_idx]}" for group_idx in failed_groups],
+                                            "Number of Products Failed": failure_counts[failed_groups],
+                                        }))
+
+                                missing_concepts = [
+                                    "Missing: " + ", ".join(group_labels[idx] for idx in failed_indices)
+                                    for failed_indices in analysis_result['irrelevant_failed_indices']
+                                ]
+
+                                df_irrelevant = pd.DataFrame({**irrelevant_columns, "Missing Concepts": missing_concepts})
+                                st.dataframe(df_irrelevant, use_container_width=True)
+                            else:
+                                st.info("No irrelevant products found.")
+
+                        with col_relevant:
+                            if relevant_count:
+                                st.success(f"✅ Found {relevant_count} Relevant Products")
+                                df_relevant = pd.DataFrame(relevant_columns)
+                                st.dataframe(df_relevant, use_container_width=True)
+                            else:
+                                st.info("No relevant products found.")
+
+                        if not irrelevant_count and total > 0:
+                            st.success("Perfect! All returned products were relevant.")